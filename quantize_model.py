@@ -0,0 +1,74 @@
+"""Quantize MobileNet-SSD to INT8 for faster CPU inference.
+
+The Caffe model must first be converted to ONNX offline (e.g. with mmdnn:
+`mmconvert -sf caffe -in MobileNetSSD_deploy.prototxt
+-iw MobileNetSSD_deploy.caffemodel -df onnx -om MobileNetSSD_deploy.onnx`).
+This script then calibrates on ~100 images already fetched into
+image_data/metadata.json and writes MobileNetSSD_int8.onnx, which
+v4 (main).py picks up automatically on startup.
+"""
+
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+import requests
+
+FP32_MODEL = "MobileNetSSD_deploy.onnx"
+INT8_MODEL = "MobileNetSSD_int8.onnx"
+META_FILE = os.path.join("image_data", "metadata.json")
+CALIBRATION_SAMPLES = 100
+
+
+def _load_calibration_blobs():
+    """Download previously indexed images and preprocess them like v4 does."""
+    with open(META_FILE, "r") as f:
+        images_data = json.load(f)
+
+    blobs = []
+    for item in images_data:
+        if len(blobs) >= CALIBRATION_SAMPLES:
+            break
+        try:
+            response = requests.get(item["url"], timeout=5)
+            img_array = np.asarray(bytearray(response.content), dtype=np.uint8)
+            image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            blobs.append(cv2.dnn.blobFromImage(image, 0.007843, (300, 300), 127.5))
+        except Exception:
+            continue
+    return blobs
+
+
+def main():
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantType,
+        quantize_static,
+    )
+
+    if not os.path.exists(FP32_MODEL):
+        sys.exit(f"🛑 {FP32_MODEL} not found. Convert the Caffe model to ONNX first.")
+    if not os.path.exists(META_FILE):
+        sys.exit("🛑 No image_data/metadata.json to calibrate on. Run a search first.")
+
+    input_name = ort.InferenceSession(FP32_MODEL).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self.blobs = iter(_load_calibration_blobs())
+
+        def get_next(self):
+            blob = next(self.blobs, None)
+            return None if blob is None else {input_name: blob}
+
+    quantize_static(FP32_MODEL, INT8_MODEL, _Reader(), weight_type=QuantType.QInt8)
+    print(f"✅ Wrote {INT8_MODEL}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 import os
+import heapq
 import requests
-import json
+import orjson
 import math
+import re
+import sqlite3
 import time
-from collections import defaultdict
+import numpy as np
+from numba import njit, prange, get_num_threads, get_thread_id
+from collections import Counter, defaultdict
+from functools import lru_cache
 from flask import Flask, request, render_template
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -19,11 +27,23 @@ if not API_KEY or not CX:
 # Directories & Files
 DATA_DIR = "image_data"
 META_FILE = os.path.join(DATA_DIR, "metadata.json")
+DB_FILE = os.path.join(DATA_DIR, "images.db")
 
 # Create directory if not exists
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
+# Shared session with connection pooling: one TCP+TLS handshake per host
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+SESSION.headers.update({"User-Agent": "Mozilla/5.0 (image-search-assignment)"})
+
 
 def fetch_images_google(queries, total_images=1000, per_request=10):
     """Fetch images from Google Custom Search API. Returns None if quota is exceeded."""
@@ -46,7 +66,7 @@ def fetch_images_google(queries, total_images=1000, per_request=10):
             "cx": CX,
         }
 
-        response = requests.get(url, params=params)
+        response = SESSION.get(url, params=params)
 
         if response.status_code == 429:
             print("⚠️ Google API quota exceeded. Switching to Wikipedia...")
@@ -85,7 +105,7 @@ def fetch_images_wikipedia(queries, total_images=1000):
     for query in queries:
         query = query.replace(" ", "_")  # Format for Wikipedia API
         url = f"https://en.wikipedia.org/api/rest_v1/page/media-list/{query}"
-        response = requests.get(url)
+        response = SESSION.get(url)
 
         if response.status_code != 200:
             print(f"❌ Wikipedia API Error for {query}: {response.status_code}")
@@ -126,85 +146,265 @@ def fetch_images(queries, total_images=1000):
         images_data = fetch_images_wikipedia(queries, total_images)
 
     if images_data:
-        with open(META_FILE, "w") as f:
-            json.dump(images_data, f, indent=4)
+        # Pre-tokenize at ingestion so index rebuilds skip tokenization
+        for item in images_data:
+            item["_tokens"] = preprocess(item.get("title", ""))
+        with open(META_FILE, "wb") as f:
+            f.write(orjson.dumps(images_data, option=orjson.OPT_INDENT_2))
 
     print(f"✅ Total fetched images: {len(images_data)}")
     return images_data
 
 
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
 def preprocess(text):
-    """Tokenizes and normalizes text."""
-    return [word.lower() for word in text.split() if word.isalnum()]
+    """Tokenizes and normalizes text in a single C-level regex scan."""
+    return _TOKEN_RE.findall(text.lower())
 
 
-def build_index():
-    """Creates an inverted index from fetched images."""
+def load_metadata():
+    """Loads metadata.json into a structure-of-arrays layout: parallel tuples
+    avoid the per-dict overhead and hash lookups of a list of dicts."""
     if not os.path.exists(META_FILE) or os.stat(META_FILE).st_size == 0:
         print("🛑 Metadata file not found. Fetching images...")
         queries = ["nature", "technology", "art", "science", "cars"]
         fetch_images(queries, total_images=1000)
 
     try:
-        with open(META_FILE, "r") as f:
-            images_data = json.load(f)
-    except json.JSONDecodeError:
+        with open(META_FILE, "rb") as f:
+            images_data = orjson.loads(f.read())
+    except orjson.JSONDecodeError:
         print("❌ Error reading metadata.json. Regenerating...")
         images_data = fetch_images(["nature", "technology", "art", "science", "cars"])
 
-    inverted_index = defaultdict(dict)
-    doc_lengths = defaultdict(int)
+    urls = tuple(image["url"] for image in images_data)
+    titles = tuple(image.get("title", "") for image in images_data)
+    contexts = tuple(image.get("context", "") for image in images_data)
+    # Tokens are precomputed at fetch time; fall back for old metadata
+    tokens = tuple(
+        image.get("_tokens") or preprocess(image.get("title", ""))
+        for image in images_data
+    )
+    return urls, titles, contexts, tokens
 
-    for i, image in enumerate(images_data):
-        doc_id = str(i)
-        text = preprocess(image["title"])
-        term_freqs = defaultdict(int)
 
-        for term in text:
-            term_freqs[term] += 1
+def build_index(doc_tokens, k1=1.5, b=0.75):
+    """Creates an inverted index with fully precomputed BM25 term weights."""
+    inverted_index = defaultdict(dict)
+    doc_lengths = np.zeros(len(doc_tokens), dtype=np.float32)
 
-        for term, freq in term_freqs.items():
+    for doc_id, text in enumerate(doc_tokens):
+        for term, freq in Counter(text).items():
             inverted_index[term][doc_id] = freq
 
         doc_lengths[doc_id] = len(text)
 
-    print(f"✅ Inverted index built with {len(inverted_index)} terms")
-    return inverted_index, doc_lengths, len(images_data)
+    total_docs = len(doc_tokens)
+    avg_doc_len = doc_lengths.mean() if total_docs > 0 else 1
+
+    # Flatten postings into CSR-like SoA arrays, baking IDF plus length
+    # normalization into the stored weight so query-time scoring is just a
+    # sum per posting. Changing k1/b requires a rebuild. The Numba kernel
+    # reads the flat arrays; WAND reads per-term slices of the same arrays,
+    # with max_weights as the per-term upper bounds.
+    term2row = {}
+    offsets = np.zeros(len(inverted_index) + 1, dtype=np.int64)
+    max_weights = np.zeros(len(inverted_index), dtype=np.float32)
+    doc_ids_per_term = []
+    weights_per_term = []
+
+    for row, (term, postings) in enumerate(inverted_index.items()):
+        doc_ids = np.fromiter(postings.keys(), dtype=np.int32, count=len(postings))
+        term_freqs = np.fromiter(
+            postings.values(), dtype=np.float32, count=len(postings)
+        )
+        doc_freq = len(doc_ids)
+        idf = math.log((total_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
+        denom = term_freqs + k1 * (1 - b + b * (doc_lengths[doc_ids] / avg_doc_len))
+        weights = (idf * (term_freqs * (k1 + 1)) / denom).astype(np.float32)
+
+        term2row[term] = row
+        offsets[row + 1] = offsets[row] + doc_freq
+        max_weights[row] = weights.max()
+        doc_ids_per_term.append(doc_ids)
+        weights_per_term.append(weights)
+
+    if doc_ids_per_term:
+        docids_flat = np.concatenate(doc_ids_per_term)
+        weights_flat = np.concatenate(weights_per_term)
+    else:
+        docids_flat = np.zeros(0, dtype=np.int32)
+        weights_flat = np.zeros(0, dtype=np.float32)
+
+    print(f"✅ Inverted index built with {len(term2row)} terms")
+    index = (term2row, offsets, docids_flat, weights_flat, max_weights)
+    return index, doc_lengths, total_docs
+
+
+def build_fts_index(titles, urls):
+    """Mirror metadata into a SQLite FTS5 table so ranking can run in C."""
+    try:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        conn.execute("DROP TABLE IF EXISTS images")
+        conn.execute(
+            "CREATE VIRTUAL TABLE images"
+            " USING fts5(title, url UNINDEXED, tokenize='porter')"
+        )
+        conn.executemany(
+            "INSERT INTO images (rowid, title, url) VALUES (?, ?, ?)",
+            [(i + 1, title, url) for i, (title, url) in enumerate(zip(titles, urls))],
+        )
+        conn.commit()
+        print(f"✅ FTS5 index built with {len(urls)} documents")
+        return conn
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ SQLite FTS5 unavailable, falling back to Python BM25: {e}")
+        return None
+
+
+@njit(parallel=True, cache=True)
+def _bm25_kernel(n_docs, rows, counts, offsets, docids_flat, weights_flat):
+    """Sum precomputed BM25 weights over the query terms' flat postings.
+
+    Each thread accumulates into its own row to avoid write races, then the
+    per-thread partials are reduced. counts carries the query-term
+    multiplicity so duplicate terms are scored without retraversal."""
+    partial = np.zeros((get_num_threads(), n_docs), dtype=np.float32)
+    for t in prange(len(rows)):
+        tid = get_thread_id()
+        row = rows[t]
+        count = counts[t]
+        for i in range(offsets[row], offsets[row + 1]):
+            partial[tid, docids_flat[i]] += count * weights_flat[i]
+    return partial.sum(axis=0)
+
+
+def _top_k_from_scores(scores, k=10):
+    """Bounded top-k over a dense score array via argpartition."""
+    matched = np.flatnonzero(scores)
+    if matched.size == 0:
+        return []
+    k = min(k, matched.size)
+    top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+    top = top[np.argsort(-scores[top])]
+    return [(int(doc_id), float(scores[doc_id])) for doc_id in top]
+
+
+def _wand_top_k(term_postings, k=10):
+    """Exact top-k BM25 via WAND: skip docs that cannot beat the threshold."""
+    heap = []  # min-heap of (score, doc_id)
+    threshold = 0.0
+    # One cursor per query term: [doc_ids, weights, max_weight, position]
+    cursors = [[doc_ids, weights, max_w, 0] for doc_ids, weights, max_w in term_postings]
+
+    while cursors:
+        # Document-at-a-time: order cursors by the doc they currently point at
+        cursors.sort(key=lambda c: c[0][c[3]])
+
+        # Pivot: first cursor where the sum of upper bounds can beat the heap
+        upper_bound = 0.0
+        pivot = None
+        for i, cursor in enumerate(cursors):
+            upper_bound += cursor[2]
+            if upper_bound > threshold:
+                pivot = i
+                break
+        if pivot is None:
+            break  # no remaining doc can enter the top-k
+        pivot_doc = cursors[pivot][0][cursors[pivot][3]]
+
+        if cursors[0][0][cursors[0][3]] == pivot_doc:
+            # Every cursor at or before the pivot sits on pivot_doc: score it
+            score = 0.0
+            for cursor in cursors:
+                doc_ids, weights, _, pos = cursor
+                if doc_ids[pos] != pivot_doc:
+                    break
+                score += float(weights[pos])
+                cursor[3] = pos + 1
+            if len(heap) < k:
+                heapq.heappush(heap, (score, pivot_doc))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, pivot_doc))
+            if len(heap) == k:
+                threshold = heap[0][0]
+        else:
+            # Skip the leading cursors forward to the pivot document
+            for cursor in cursors:
+                doc_ids, _, _, pos = cursor
+                if doc_ids[pos] >= pivot_doc:
+                    break
+                cursor[3] = pos + int(np.searchsorted(doc_ids[pos:], pivot_doc))
+
+        cursors = [c for c in cursors if c[3] < len(c[0])]
+
+    return [(int(doc_id), score) for score, doc_id in sorted(heap, reverse=True)]
 
 
 def search(query, inverted_index, doc_lengths, total_docs, model="bm25"):
     """Retrieve relevant images using BM25 ranking."""
     query_terms = preprocess(query)
-    scores = defaultdict(float)
+    term2row, offsets, docids_flat, weights_flat, max_weights = inverted_index
+
+    # Deduplicate query terms (weighting by multiplicity) and drop OOV terms
+    # up front so each posting list is traversed at most once
+    query_counts = [
+        (row, count)
+        for term, count in Counter(query_terms).items()
+        if (row := term2row.get(term)) is not None
+    ]
+    if not query_counts:
+        return []
 
     if model == "bm25":
-        k1, b = 1.5, 0.75
-        avg_doc_len = sum(doc_lengths.values()) / total_docs if total_docs > 0 else 1
-
-        for term in query_terms:
-            if term in inverted_index:
-                doc_freq = len(inverted_index[term])
-                idf = (
-                    math.log((total_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
-                    if doc_freq > 0
-                    else 0
-                )
-                for doc_id, term_freq in inverted_index[term].items():
-                    doc_len = doc_lengths[doc_id]
-                    score = idf * (
-                        (term_freq * (k1 + 1))
-                        / (term_freq + k1 * (1 - b + b * (doc_len / avg_doc_len)))
-                    )
-                    scores[doc_id] += score
-
-    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        rows = np.array([row for row, _ in query_counts], dtype=np.int64)
+        counts = np.array([count for _, count in query_counts], dtype=np.float32)
+        scores = _bm25_kernel(
+            total_docs, rows, counts, offsets, docids_flat, weights_flat
+        )
+        return _top_k_from_scores(scores)
+
+    if model == "wand":
+        term_postings = []
+        for row, count in query_counts:
+            start, end = offsets[row], offsets[row + 1]
+            weights = weights_flat[start:end]
+            if count > 1:
+                weights = weights * count
+            term_postings.append(
+                (docids_flat[start:end], weights, float(max_weights[row]) * count)
+            )
+        return _wand_top_k(term_postings)
+
+    if model == "fts5" and fts_conn is not None and query_terms:
+        # FTS5's bm25() is smaller-is-better, hence the negation
+        rows = fts_conn.execute(
+            "SELECT rowid - 1, -bm25(images) FROM images"
+            " WHERE images MATCH ? ORDER BY bm25(images) LIMIT 10",
+            (" ".join(query_terms),),
+        ).fetchall()
+        return [(int(doc_id), float(score)) for doc_id, score in rows]
+
+    return []
 
 
 # Flask Web App
 app = Flask(__name__)
 
+# Parse metadata once at startup into parallel tuples (SoA layout)
+IMAGE_URLS, IMAGE_TITLES, IMAGE_CONTEXTS, IMAGE_TOKENS = load_metadata()
+
 # Build index
-data, lengths, total = build_index()
+data, lengths, total = build_index(IMAGE_TOKENS)
+fts_conn = build_fts_index(IMAGE_TITLES, IMAGE_URLS)
+
+
+@lru_cache(maxsize=256)
+def _search_cached(query):
+    """Memoize per-query results so identical repeat queries return in O(1)."""
+    return tuple(search(query, data, lengths, total))
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -212,15 +412,10 @@ def index():
     results = []
     if request.method == "POST":
         query = request.form["query"]
-        results = search(query, data, lengths, total)
-
-        with open(META_FILE, "r") as f:
-            images_data = json.load(f)
-
         results = [
-            (images_data[int(doc_id)]["url"], score)
-            for doc_id, score in results[:10]
-            if int(doc_id) < len(images_data)
+            (IMAGE_URLS[doc_id], score)
+            for doc_id, score in _search_cached(query)[:10]
+            if doc_id < len(IMAGE_URLS)
         ]
 
     return render_template("index.html", results=results)
@@ -1,8 +1,12 @@
 import os
+import asyncio
+import aiohttp
 import requests
-import json
+import orjson
 import time
 from flask import Flask, request, render_template
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -24,24 +28,50 @@ META_FILE = os.path.join(DATA_DIR, "metadata.json")
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
+# Shared session with connection pooling: one TCP+TLS handshake per host
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+SESSION.headers.update({"User-Agent": "Mozilla/5.0 (image-search-assignment)"})
+
+
+async def _gather_json(url, headers, make_params, queries):
+    """Fire one request per query concurrently, bounded to respect rate limits."""
+    semaphore = asyncio.Semaphore(8)
+
+    async def _fetch_one(session, query):
+        async with semaphore:
+            try:
+                async with session.get(url, params=make_params(query)) as response:
+                    if response.status != 200:
+                        print(f"❌ API Error for {query}: {response.status}")
+                        return None
+                    return await response.json()
+            except Exception as e:
+                print(f"❌ Request failed for {query}: {e}")
+                return None
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        return await asyncio.gather(*[_fetch_one(session, query) for query in queries])
+
 
 def fetch_images_pexels(queries, total_images=1000):
-    """Fetch images from Pexels first."""
+    """Fetch images from Pexels first, all queries in flight at once."""
     print("📷 Fetching images from Pexels...")
     images_data = []
     headers = {"Authorization": PEXELS_API_KEY}
+    url = "https://api.pexels.com/v1/search"
+    responses = asyncio.run(
+        _gather_json(url, headers, lambda q: {"query": q, "per_page": 30}, queries)
+    )
 
-    for query in queries:
-        url = "https://api.pexels.com/v1/search"
-        params = {"query": query, "per_page": 30}
-        response = requests.get(url, headers=headers, params=params)
-
-        if response.status_code != 200:
-            print(f"❌ Pexels API Error for {query}: {response.status_code}")
-            continue
-
-        data = response.json()
-        if "photos" not in data:
+    for query, data in zip(queries, responses):
+        if not data or "photos" not in data:
             print(f"⚠️ No images found for Pexels query: {query}")
             continue
 
@@ -82,7 +112,7 @@ def fetch_images_google(queries, total_images=1000, per_request=10):
             "cx": CX,
         }
 
-        response = requests.get(url, params=params)
+        response = SESSION.get(url, params=params)
 
         if response.status_code == 429:
             print("⚠️ Google API quota exceeded. Switching to Unsplash...")
@@ -118,18 +148,13 @@ def fetch_images_unsplash(queries, total_images=1000):
     print("📸 Fetching images from Unsplash...")
     images_data = []
     headers = {"Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"}
+    url = "https://api.unsplash.com/search/photos"
+    responses = asyncio.run(
+        _gather_json(url, headers, lambda q: {"query": q, "per_page": 30}, queries)
+    )
 
-    for query in queries:
-        url = "https://api.unsplash.com/search/photos"
-        params = {"query": query, "per_page": 30}
-        response = requests.get(url, headers=headers, params=params)
-
-        if response.status_code != 200:
-            print(f"❌ Unsplash API Error for {query}: {response.status_code}")
-            continue
-
-        data = response.json()
-        if "results" not in data:
+    for query, data in zip(queries, responses):
+        if not data or "results" not in data:
             print(f"⚠️ No images found for Unsplash query: {query}")
             continue
 
@@ -159,8 +184,8 @@ def fetch_images(queries, total_images=1000):
         images_data = fetch_images_unsplash(queries, total_images)
 
     if images_data:
-        with open(META_FILE, "w") as f:
-            json.dump(images_data, f, indent=4)
+        with open(META_FILE, "wb") as f:
+            f.write(orjson.dumps(images_data, option=orjson.OPT_INDENT_2))
 
     print(f"✅ Total fetched images: {len(images_data)}")
     return images_data
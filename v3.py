@@ -1,10 +1,14 @@
 import os
+import heapq
+import operator
 import requests
-import json
+import orjson
 import math
-from collections import defaultdict
-from bs4 import BeautifulSoup
+from collections import Counter, defaultdict
+from selectolax.parser import HTMLParser
 from flask import Flask, request, render_template
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -24,26 +28,43 @@ META_FILE = os.path.join(DATA_DIR, "metadata.json")
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
+# Shared session with connection pooling: one TCP+TLS handshake per host
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+SESSION.headers.update({"User-Agent": "Mozilla/5.0 (image-search-assignment)"})
+
 
 ### ======= Web Crawler for Image Collection ======= ###
+def _figure_caption(node):
+    """Return the text of the enclosing <figure>, if any."""
+    parent = node.parent
+    while parent is not None:
+        if parent.tag == "figure":
+            return parent.text().strip()
+        parent = parent.parent
+    return ""
+
+
 def crawl_images(url, max_images=400):
     """Crawl images and their metadata from a webpage."""
     print(f"🕷 Crawling images from {url}...")
     images_data = []
     try:
-        response = requests.get(url, timeout=5)
+        response = SESSION.get(url, timeout=5)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        images = soup.find_all("img")
+        tree = HTMLParser(response.text)
+        images = tree.css("img")
 
         for img in images[:max_images]:
-            img_url = img.get("src", "")
-            alt_text = img.get("alt") or ""
-            caption = (
-                img.find_parent("figure").text.strip()
-                if img.find_parent("figure")
-                else ""
-            )
+            img_url = img.attributes.get("src") or ""
+            alt_text = img.attributes.get("alt") or ""
+            caption = _figure_caption(img)
             images_data.append(
                 {
                     "url": img_url,
@@ -65,7 +86,7 @@ def fetch_images_google(query, total_images=300):
     url = "https://www.googleapis.com/customsearch/v1"
     params = {"q": query, "cx": CX, "key": API_KEY, "searchType": "image", "num": 10}
     try:
-        response = requests.get(url, params=params, timeout=5)
+        response = SESSION.get(url, params=params, timeout=5)
         response.raise_for_status()
         data = response.json()
         for item in data.get("items", []):
@@ -93,7 +114,7 @@ def fetch_images_unsplash(query, total_images=300):
     url = "https://api.unsplash.com/search/photos"
     params = {"query": query, "per_page": 10}
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=5)
+        response = SESSION.get(url, headers=headers, params=params, timeout=5)
         response.raise_for_status()
         data = response.json()
         for item in data.get("results", []):
@@ -125,8 +146,8 @@ def build_index(image_data):
         terms = (alt_text + " " + caption).lower().split()
         doc_lengths[doc_id] = len(terms)
 
-        for term in set(terms):
-            inverted_index[term].append(doc_id)
+        for term, tf in Counter(terms).items():
+            inverted_index[term].append((doc_id, tf))
 
     return inverted_index, doc_lengths
 
@@ -137,21 +158,24 @@ def compute_bm25_scores(query, inverted_index, doc_lengths, total_docs, k1=1.5,
     scores = defaultdict(float)
     avg_doc_length = sum(doc_lengths.values()) / len(doc_lengths) if doc_lengths else 1
 
-    query_terms = query.lower().split()
-    for term in query_terms:
-        if term in inverted_index:
-            df = len(inverted_index[term])
-            idf = math.log((total_docs - df + 0.5) / (df + 0.5) + 1)
+    # Deduplicate query terms so each posting list is traversed at most once
+    for term, count in Counter(query.lower().split()).items():
+        postings = inverted_index.get(term)
+        if postings is None:
+            continue
+
+        df = len(postings)
+        idf = math.log((total_docs - df + 0.5) / (df + 0.5) + 1)
 
-            for doc_id in inverted_index[term]:
-                tf = inverted_index[term].count(doc_id)
-                doc_length = doc_lengths[doc_id]
-                norm_tf = (tf * (k1 + 1)) / (
-                    tf + k1 * (1 - b + b * (doc_length / avg_doc_length))
-                )
-                scores[doc_id] += idf * norm_tf
+        for doc_id, tf in postings:
+            doc_length = doc_lengths[doc_id]
+            norm_tf = (tf * (k1 + 1)) / (
+                tf + k1 * (1 - b + b * (doc_length / avg_doc_length))
+            )
+            scores[doc_id] += count * idf * norm_tf
 
-    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    # Bounded heap: only the top 10 are ever shown, so skip the full sort
+    return heapq.nlargest(10, scores.items(), key=operator.itemgetter(1))
 
 
 ### ======= Fetch & Index Images Dynamically ======= ###
@@ -164,8 +188,8 @@ def fetch_and_index_images(query):
     )
 
     if images_data:
-        with open(META_FILE, "w") as f:
-            json.dump(images_data, f, indent=4)
+        with open(META_FILE, "wb") as f:
+            f.write(orjson.dumps(images_data, option=orjson.OPT_INDENT_2))
 
     inverted_index, doc_lengths = build_index(images_data)
     total_docs = len(images_data)